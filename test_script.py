@@ -13,93 +13,114 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent))
 
 try:
-    from weather_server import get_current_weather, get_forecast, get_weather_by_city, make_openmeteo_request
+    from weather_server_main import (
+        close_client, get_current_weather, get_forecast, get_weather_by_city,
+        get_weather_for_cities, make_openmeteo_request
+    )
     print("✅ Successfully imported weather server modules")
 except ImportError as e:
     print(f"❌ Failed to import weather server modules: {e}")
     sys.exit(1)
 
-async def test_api_connectivity():
+async def test_api_connectivity() -> tuple[bool, list[str]]:
     """Test basic API connectivity"""
-    print("\n🌐 Testing API connectivity...")
+    lines = ["\n🌐 Testing API connectivity..."]
     
     url = "https://api.open-meteo.com/v1/forecast?latitude=13.7563&longitude=100.5018&current=temperature_2m"
     result = await make_openmeteo_request(url)
     
     if result:
-        print("✅ API connectivity successful")
-        return True
+        lines.append("✅ API connectivity successful")
+        return True, lines
     else:
-        print("❌ API connectivity failed")
-        return False
+        lines.append("❌ API connectivity failed")
+        return False, lines
 
-async def test_current_weather():
+async def test_current_weather() -> tuple[bool, list[str]]:
     """Test current weather function"""
-    print("\n🌡️  Testing current weather function...")
+    lines = ["\n🌡️  Testing current weather function..."]
     
     # Test Bangkok coordinates
     lat, lon = 13.7563, 100.5018
     result = await get_current_weather(lat, lon)
     
     if result and result != "Unable to fetch weather data.":
-        print("✅ Current weather function working")
+        lines.append("✅ Current weather function working")
         try:
             data = json.loads(result)
             if "current" in data:
-                print(f"   📊 Sample data: Temperature = {data['current'].get('temperature_2m', 'N/A')}°C")
-            return True
+                lines.append(f"   📊 Sample data: Temperature = {data['current'].get('temperature_2m', 'N/A')}°C")
+            return True, lines
         except json.JSONDecodeError:
-            print("⚠️  Current weather function working but returned non-JSON data")
-            return True
+            lines.append("⚠️  Current weather function working but returned non-JSON data")
+            return True, lines
     else:
-        print("❌ Current weather function failed")
-        return False
+        lines.append("❌ Current weather function failed")
+        return False, lines
 
-async def test_forecast():
+async def test_forecast() -> tuple[bool, list[str]]:
     """Test weather forecast function"""
-    print("\n📅 Testing weather forecast function...")
+    lines = ["\n📅 Testing weather forecast function..."]
     
     # Test Tokyo coordinates
     lat, lon = 35.6762, 139.6503
     result = await get_forecast(lat, lon)
     
     if result and result != "Unable to fetch forecast data.":
-        print("✅ Weather forecast function working")
-        lines = result.split('\n')
-        print(f"   📊 Forecast contains {len([l for l in lines if l.startswith('Date:')])} days")
-        return True
+        lines.append("✅ Weather forecast function working")
+        forecast_lines = result.split('\n')
+        lines.append(f"   📊 Forecast contains {len([l for l in forecast_lines if l.startswith('Date:')])} days")
+        return True, lines
     else:
-        print("❌ Weather forecast function failed")
-        return False
+        lines.append("❌ Weather forecast function failed")
+        return False, lines
 
-async def test_city_weather():
+async def test_city_weather() -> tuple[bool, list[str]]:
     """Test city-based weather function"""
-    print("\n🏙️  Testing city weather function...")
+    lines = ["\n🏙️  Testing city weather function..."]
     
     result = await get_weather_by_city("bangkok")
     
     if result and not result.startswith("Sorry"):
-        print("✅ City weather function working")
-        return True
+        lines.append("✅ City weather function working")
+        return True, lines
     else:
-        print("❌ City weather function failed or city not found")
-        return False
+        lines.append("❌ City weather function failed or city not found")
+        return False, lines
 
-async def test_error_handling():
+async def test_multi_city_weather() -> tuple[bool, list[str]]:
+    """Test multi-city weather function"""
+    lines = ["\n🌏 Testing multi-city weather function..."]
+    
+    cities = ["bangkok", "tokyo"]
+    result = await get_weather_for_cities(cities)
+    sections = result.split("\n---\n")
+    
+    if len(sections) == len(cities) and all(
+        section.startswith(f"{city}:\n{{") for city, section in zip(cities, sections)
+    ):
+        lines.append(f"✅ Multi-city weather function working ({len(sections)} cities)")
+        return True, lines
+    else:
+        lines.append("❌ Multi-city weather function failed")
+        return False, lines
+
+async def test_error_handling() -> tuple[bool, list[str]]:
     """Test error handling with invalid coordinates"""
-    print("\n⚠️  Testing error handling...")
+    lines = ["\n⚠️  Testing error handling..."]
     
-    # Test with invalid coordinates (should handle gracefully)
-    result = await get_current_weather(999, 999)
+    # Out-of-range coordinates must be rejected before any API call is made
+    current = await get_current_weather(999, 999)
+    forecast = await get_forecast(-91, 0)
     
-    if result:
-        print("✅ Error handling working (returned result for invalid coords)")
-        return True
+    if current == forecast == "Invalid coordinates.":
+        lines.append("✅ Error handling working (rejected invalid coords without an API call)")
+        return True, lines
     else:
-        print("✅ Error handling working (gracefully handled invalid coords)")
-        return True
+        lines.append(f"❌ Invalid coords were not rejected: {current!r}, {forecast!r}")
+        return False, lines
 
-def test_imports():
+def test_imports() -> bool:
     """Test that all required modules can be imported"""
     print("📦 Testing imports...")
     
@@ -119,7 +140,7 @@ def test_imports():
     
     return True
 
-async def run_all_tests():
+async def run_all_tests() -> bool:
     """Run all tests and provide a summary"""
     print("🧪 Weather MCP Server Test Suite")
     print("=" * 50)
@@ -135,17 +156,26 @@ async def run_all_tests():
         test_current_weather,
         test_forecast,
         test_city_weather,
+        test_multi_city_weather,
         test_error_handling
     ]
     
+    # The tests are independent, so run them concurrently to overlap API round-trips;
+    # each returns its output lines, which are printed in order once all finish
+    try:
+        outcomes = await asyncio.gather(*[test() for test in tests], return_exceptions=True)
+    finally:
+        await close_client()
+    
     results = []
-    for test in tests:
-        try:
-            result = await test()
-            results.append(result)
-        except Exception as e:
-            print(f"❌ Test {test.__name__} failed with exception: {e}")
+    for test, outcome in zip(tests, outcomes):
+        if isinstance(outcome, BaseException):
+            print(f"❌ Test {test.__name__} failed with exception: {outcome}")
             results.append(False)
+        else:
+            result, lines = outcome
+            print("\n".join(lines))
+            results.append(result)
     
     # Summary
     print("\n" + "=" * 50)
@@ -173,5 +203,10 @@ async def run_all_tests():
 
 if __name__ == "__main__":
     print("Starting Weather MCP Server tests...\n")
-    success = asyncio.run(run_all_tests())
+    try:
+        import uvloop
+    except ImportError:
+        success = asyncio.run(run_all_tests())
+    else:
+        success = uvloop.run(run_all_tests())
     sys.exit(0 if success else 1)
\ No newline at end of file
@@ -1,43 +1,299 @@
-from typing import Any
+from collections.abc import AsyncIterator, Mapping
+from contextlib import AbstractAsyncContextManager, asynccontextmanager, nullcontext
+from typing import TYPE_CHECKING, Any, Final, NamedTuple
+import asyncio
 import httpx
+import importlib.util
 import json
+import logging
 import ssl
 import os
+import sys
+import time
+from types import MappingProxyType, ModuleType
 from mcp.server.fastmcp import FastMCP
 
-print("Starting weather service...")
-mcp = FastMCP('weather')
+if TYPE_CHECKING:
+    import orjson
+else:
+    try:
+        import orjson
+    except ImportError:
+        # orjson is an optional speedup; fall back to the stdlib json module
+        orjson = None
+
+aiolimiter: ModuleType | None
+try:
+    import aiolimiter
+except ImportError:
+    # aiolimiter is optional; without it requests are not rate-limited
+    aiolimiter = None
+
+# HTTP/2 and brotli decoding need httpx's optional extras (httpx[http2,brotli])
+_HTTP2 = importlib.util.find_spec("h2") is not None
+_BROTLI = any(importlib.util.find_spec(name) for name in ("brotli", "brotlicffi"))
+
+# Log to stderr: on the stdio transport, stdout carries the MCP protocol
+logging.basicConfig(stream=sys.stderr, level=logging.INFO)
+log = logging.getLogger("weather")
+
+log.info("Starting weather service...")
 
 # Configuration
 api_base = 'https://api.open-meteo.com/v1'
 user_agent = 'weather-app/1.0'
 
+# URL template fetching current conditions and the daily forecast in one request
+_WEATHER_URL = api_base + "/forecast?latitude={lat}&longitude={lon}&current=temperature_2m,relative_humidity_2m,apparent_temperature,precipitation,weather_code&daily=temperature_2m_max,temperature_2m_min,precipitation_sum&timezone=auto"
+
 # SSL Configuration for corporate environments
 SSL_CONFIG = True
 if os.getenv('SSL_VERIFY', '').lower() == 'false':
     SSL_CONFIG = False
 
-async def make_openmeteo_request(url: str) -> dict[str, Any] | None:
-    """Make request with proper error handling."""
-    headers = {
-        "User-Agent": user_agent,
-        "Accept": "application/json"
-    }
+# Build the SSL context (and load the CA bundle) once at startup
+_SSL_CTX: ssl.SSLContext | bool = httpx.create_ssl_context() if SSL_CONFIG else False
+
+# Simple geocoding for major cities. A dict keeps lookups O(1) as the table
+# grows; its keys' hashes are cached, so a lookup only hashes the query.
+_CITY_COORDS: Final[Mapping[str, tuple[float, float]]] = MappingProxyType({
+    "bangkok": (13.7563, 100.5018),
+    "tokyo": (35.6762, 139.6503),
+    "new york": (40.7128, -74.0060),
+    "london": (51.5074, -0.1278),
+    "paris": (48.8566, 2.3522),
+    "singapore": (1.3521, 103.8198),
+    "sydney": (-33.8688, 151.2093),
+    "los angeles": (34.0522, -118.2437)
+})
+_POPULAR_CITIES_STR: Final[str] = "\n".join(
+    f"{name.title()} ({lat:.4f}, {lon:.4f})" for name, (lat, lon) in _CITY_COORDS.items()
+)
+
+# Response cache: weather doesn't change second-to-second, so repeated tool
+# calls for the same URL are served from memory (TTL in seconds)
+CACHE_TTL = float(os.getenv('WEATHER_CACHE_TTL', '300'))
+# Expired entries with ETag/Last-Modified validators are kept this much longer
+# so they can be revalidated with a conditional GET instead of re-downloaded
+REVALIDATE_WINDOW = 3600.0
+
+class _CacheEntry(NamedTuple):
+    expires_at: float
+    data: dict[str, Any]
+    etag: str | None
+    last_modified: str | None
+
+_CACHE: dict[str, _CacheEntry] = {}
+# Serialized get_current_weather output per URL, so cache hits skip re-encoding
+_TEXT_CACHE: dict[str, tuple[float, str]] = {}
+
+# Client-side rate limiting so bursts of tool calls don't trip Open-Meteo's limits
+RATE_LIMIT = float(os.getenv('WEATHER_RATE_LIMIT', '5'))
+if RATE_LIMIT <= 0:
+    raise ValueError(f"WEATHER_RATE_LIMIT must be greater than 0, got {RATE_LIMIT}")
+MAX_RETRIES = 3
+# Give up instead of retrying when the server asks us to wait longer than this
+MAX_RETRY_DELAY = 10.0
+
+# Shared HTTP client (so keep-alive connections are reused across tool calls)
+# and rate limiter. Both belong to the event loop that created them, so they are
+# created lazily for the running loop and the client is closed on that same loop.
+class _HttpState(NamedTuple):
+    loop: asyncio.AbstractEventLoop
+    client: httpx.AsyncClient
+    limiter: AbstractAsyncContextManager[Any]
+    # Fetches in progress per URL, so concurrent cache misses share one request
+    inflight: dict[str, asyncio.Task[dict[str, Any] | None]]
+
+_http: _HttpState | None = None
+
+def _discard_http(state: _HttpState) -> None:
+    """Close a client left behind by another event loop, if that loop can still run it."""
+    if state.client.is_closed:
+        return
+    if state.loop.is_running():
+        asyncio.run_coroutine_threadsafe(state.client.aclose(), state.loop)
+    else:
+        log.warning("Dropping HTTP client from a stopped event loop without closing it")
+
+def _get_http() -> _HttpState:
+    """Return the shared HTTP client and rate limiter for the running event loop."""
+    global _http
+    loop = asyncio.get_running_loop()
+    if _http is None or _http.loop is not loop or _http.client.is_closed:
+        if _http is not None and _http.loop is not loop:
+            _discard_http(_http)
+        client = httpx.AsyncClient(
+            verify=_SSL_CTX,
+            timeout=30.0,
+            headers={
+                "User-Agent": user_agent,
+                "Accept": "application/json",
+                "Accept-Encoding": "gzip, br" if _BROTLI else "gzip"
+            },
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+            http2=_HTTP2
+        )
+        limiter: AbstractAsyncContextManager[Any] = nullcontext()
+        if aiolimiter is not None and RATE_LIMIT < 1:
+            # A bucket smaller than one request can never admit one, so express
+            # slow rates as one request per 1/RATE_LIMIT seconds
+            limiter = aiolimiter.AsyncLimiter(max_rate=1, time_period=1 / RATE_LIMIT)
+        elif aiolimiter is not None:
+            limiter = aiolimiter.AsyncLimiter(max_rate=RATE_LIMIT, time_period=1)
+        _http = _HttpState(loop, client, limiter, {})
+    return _http
+
+async def close_client() -> None:
+    """Close the shared HTTP client. Call this from the loop that used it."""
+    global _http
+    if _http is not None:
+        if _http.loop is asyncio.get_running_loop():
+            await _http.client.aclose()
+        else:
+            _discard_http(_http)
+    _http = None
+
+@asynccontextmanager
+async def _lifespan(server: FastMCP) -> AsyncIterator[None]:
+    """Close the shared HTTP client when the MCP server shuts down."""
+    try:
+        yield
+    finally:
+        await close_client()
+
+mcp = FastMCP('weather', lifespan=_lifespan)
+
+def dump_json(data: Any) -> str:
+    """Serialize data to an indented JSON string, using orjson when available."""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2).decode()
+    # Match orjson's output, which writes non-ASCII characters (e.g. °C) as-is
+    return json.dumps(data, indent=2, ensure_ascii=False)
+
+def load_json(content: bytes) -> Any:
+    """Parse a JSON response body, using orjson when available."""
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+def _evict_expired(now: float) -> None:
+    """Drop cache entries whose TTL (and revalidation window, if any) has passed."""
+    for key, entry in list(_CACHE.items()):
+        keep_until = entry.expires_at
+        if entry.etag or entry.last_modified:
+            keep_until += REVALIDATE_WINDOW
+        if keep_until <= now:
+            del _CACHE[key]
+    for key in [k for k, (expires_at, _) in _TEXT_CACHE.items() if expires_at <= now]:
+        del _TEXT_CACHE[key]
+
+def _cache_ttl(response: httpx.Response, default: float) -> float:
+    """TTL for a response: the configured TTL, shortened by a smaller Cache-Control
+    max-age, or 0 when the server says no-cache/no-store."""
+    ttl = default
+    for directive in response.headers.get("cache-control", "").split(","):
+        name, _, value = directive.strip().partition("=")
+        name = name.lower()
+        if name in ("no-cache", "no-store"):
+            return 0.0
+        if name == "max-age" and value.isdigit():
+            ttl = min(ttl, float(value))
+    return ttl
+
+def _retry_delay(response: httpx.Response, attempt: int) -> float:
+    """Seconds to wait before retrying, honoring Retry-After when present."""
+    retry_after = response.headers.get("retry-after", "")
+    if retry_after.isdigit():
+        return float(retry_after)
+    return float(2 ** attempt)
+
+async def _get_with_retry(url: str, headers: dict[str, str]) -> httpx.Response:
+    """GET url through the rate limiter, backing off and retrying on HTTP 429."""
+    http = _get_http()
+    attempt = 0
+    while True:
+        async with http.limiter:
+            response = await http.client.get(url, headers=headers)
+        if response.status_code != 429 or attempt >= MAX_RETRIES:
+            return response
+        delay = _retry_delay(response, attempt)
+        if delay > MAX_RETRY_DELAY:
+            # Don't hold the tool call for a long server-requested wait
+            return response
+        await asyncio.sleep(delay)
+        attempt += 1
+
+async def make_openmeteo_request(url: str, ttl: float = CACHE_TTL) -> dict[str, Any] | None:
+    """Make request with proper error handling, caching results for ttl seconds."""
+    cached = _CACHE.get(url)
+    if cached and time.monotonic() < cached.expires_at:
+        return cached.data
+    
+    # Join a fetch of the same URL that is already running instead of starting another
+    inflight = _get_http().inflight
+    task = inflight.get(url)
+    if task is None:
+        task = asyncio.ensure_future(_request(url, ttl))
+        inflight[url] = task
+        task.add_done_callback(lambda _: inflight.pop(url, None))
+    # Shield the shared fetch so one cancelled caller doesn't cancel it for the others
+    return await asyncio.shield(task)
+
+async def _request(url: str, ttl: float) -> dict[str, Any] | None:
+    """Fetch url (revalidating any stale cache entry) and cache the result."""
+    now = time.monotonic()
+    cached = _CACHE.get(url)
+    
+    # Revalidate a stale entry so an unchanged response comes back as an empty 304
+    headers: dict[str, str] = {}
+    if cached and cached.etag:
+        headers["If-None-Match"] = cached.etag
+    if cached and cached.last_modified:
+        headers["If-Modified-Since"] = cached.last_modified
     
     try:
-        async with httpx.AsyncClient(verify=SSL_CONFIG, timeout=30.0) as client:
-            response = await client.get(url, headers=headers)
+        log.info("Making weather request to: %s", url)
+        response = await _get_with_retry(url, headers)
+        if cached and response.status_code == 304:
+            data = cached.data
+            etag = response.headers.get("etag", cached.etag)
+            last_modified = response.headers.get("last-modified", cached.last_modified)
+        else:
             response.raise_for_status()
-            return response.json()
+            data = load_json(response.content)
+            etag = response.headers.get("etag")
+            last_modified = response.headers.get("last-modified")
+        if ttl > 0:
+            ttl = _cache_ttl(response, ttl)
     except ssl.SSLError as e:
-        print(f"SSL error: {e}")
+        log.error("SSL error: %s", e)
         return None
     except httpx.HTTPStatusError as e:
-        print(f"HTTP error {e.response.status_code}")
+        log.error("HTTP error %s", e.response.status_code)
         return None
     except Exception as e:
-        print(f"Request failed: {e}")
+        log.error("Request failed: %s", e)
         return None
+    
+    _evict_expired(now)
+    if ttl > 0:
+        _CACHE[url] = _CacheEntry(now + ttl, data, etag, last_modified)
+    return data
+
+def _valid_coordinates(latitude: float, longitude: float) -> bool:
+    """Check coordinates are in range before spending a request on them."""
+    return -90.0 <= latitude <= 90.0 and -180.0 <= longitude <= 180.0
+
+async def _fetch_all(latitude: float, longitude: float) -> dict[str, Any] | None:
+    """Fetch current conditions and the daily forecast for a location in one request.
+    
+    Both get_current_weather and get_forecast read from this payload, so calling
+    one after the other is served from the cache, and calling them concurrently
+    shares a single request.
+    """
+    url = _WEATHER_URL.format(lat=latitude, lon=longitude)
+    return await make_openmeteo_request(url)
 
 @mcp.tool()
 async def get_current_weather(latitude: float, longitude: float) -> str:
@@ -50,14 +306,27 @@ async def get_current_weather(latitude: float, longitude: float) -> str:
     Returns:
         str: JSON string with current weather data
     """
-    url = f"{api_base}/forecast?latitude={latitude}&longitude={longitude}&current=temperature_2m,relative_humidity_2m,apparent_temperature,precipitation,weather_code"
+    if not _valid_coordinates(latitude, longitude):
+        return "Invalid coordinates."
+    
+    url = _WEATHER_URL.format(lat=latitude, lon=longitude)
+    cached = _TEXT_CACHE.get(url)
+    if cached and time.monotonic() < cached[0]:
+        return cached[1]
     
-    print(f"Making weather request to: {url}")
-    data = await make_openmeteo_request(url)
+    data = await _fetch_all(latitude, longitude)
     if not data:
         return "Unable to fetch weather data."
     
-    return json.dumps(data, indent=2)
+    # Leave out the daily forecast that shares this payload
+    current = {key: value for key, value in data.items() if not key.startswith("daily")}
+    text = dump_json(current)
+    
+    # Keep the text for as long as the payload it was built from stays cached
+    entry = _CACHE.get(url)
+    if entry:
+        _TEXT_CACHE[url] = (entry.expires_at, text)
+    return text
 
 @mcp.tool()
 async def get_forecast(latitude: float, longitude: float) -> str:
@@ -70,23 +339,27 @@ async def get_forecast(latitude: float, longitude: float) -> str:
     Returns:
         str: Formatted weather forecast
     """
-    url = f"{api_base}/forecast?latitude={latitude}&longitude={longitude}&daily=temperature_2m_max,temperature_2m_min,precipitation_sum,weather_code&timezone=auto"
+    if not _valid_coordinates(latitude, longitude):
+        return "Invalid coordinates."
     
-    print(f"Making forecast request to: {url}")
-    data = await make_openmeteo_request(url)
+    data = await _fetch_all(latitude, longitude)
     if not data:
         return "Unable to fetch forecast data."
     
     # Format the data for readability
     daily = data.get("daily", {})
-    forecasts = []
-    
-    for i in range(len(daily.get("time", []))):
-        forecast = f"""Date: {daily['time'][i]}
-Max Temperature: {daily['temperature_2m_max'][i]}°C
-Min Temperature: {daily['temperature_2m_min'][i]}°C
-Precipitation: {daily['precipitation_sum'][i]} mm"""
-        forecasts.append(forecast)
+    forecasts = [
+        f"""Date: {date}
+Max Temperature: {temp_max}°C
+Min Temperature: {temp_min}°C
+Precipitation: {precipitation} mm"""
+        for date, temp_max, temp_min, precipitation in zip(
+            daily.get("time", []),
+            daily.get("temperature_2m_max", []),
+            daily.get("temperature_2m_min", []),
+            daily.get("precipitation_sum", [])
+        )
+    ]
     
     return "\n---\n".join(forecasts)
 
@@ -100,40 +373,38 @@ async def get_weather_by_city(city_name: str) -> str:
     Returns:
         str: Weather information for the city
     """
-    # Simple geocoding for major cities
-    city_coordinates = {
-        "bangkok": (13.7563, 100.5018),
-        "tokyo": (35.6762, 139.6503),
-        "new york": (40.7128, -74.0060),
-        "london": (51.5074, -0.1278),
-        "paris": (48.8566, 2.3522),
-        "singapore": (1.3521, 103.8198),
-        "sydney": (-33.8688, 151.2093),
-        "los angeles": (34.0522, -118.2437)
-    }
-    
-    city_lower = city_name.lower()
-    if city_lower in city_coordinates:
-        lat, lon = city_coordinates[city_lower]
+    coords = _CITY_COORDS.get(city_name.casefold())
+    if coords:
+        lat, lon = coords
         return await get_current_weather(lat, lon)
     else:
         return f"Sorry, coordinates for '{city_name}' are not available. Please provide latitude and longitude coordinates."
 
+@mcp.tool()
+async def get_weather_for_cities(cities: list[str]) -> str:
+    """Get current weather for several cities at once.
+    
+    Args:
+        cities: Names of the cities
+        
+    Returns:
+        str: Weather information for each city
+    """
+    # Fetch all cities concurrently over the shared client
+    results = await asyncio.gather(*(get_weather_by_city(city) for city in cities))
+    return "\n---\n".join(f"{city}:\n{result}" for city, result in zip(cities, results))
+
 @mcp.resource("weather://popular-cities")
 async def get_popular_cities():
     """Get list of popular cities with weather support."""
-    cities = [
-        "Bangkok (13.7563, 100.5018)",
-        "Tokyo (35.6762, 139.6503)", 
-        "New York (40.7128, -74.0060)",
-        "London (51.5074, -0.1278)",
-        "Paris (48.8566, 2.3522)",
-        "Singapore (1.3521, 103.8198)",
-        "Sydney (-33.8688, 151.2093)",
-        "Los Angeles (34.0522, -118.2437)"
-    ]
-    return "\n".join(cities)
+    return _POPULAR_CITIES_STR
 
 if __name__ == "__main__":
-    # Run the MCP server using stdio transport for Claude Desktop
-    mcp.run(transport='stdio')
\ No newline at end of file
+    # Run the MCP server using stdio transport for Claude Desktop, on uvloop's
+    # faster event loop when it's installed (not available on Windows)
+    try:
+        import uvloop
+    except ImportError:
+        mcp.run(transport='stdio')
+    else:
+        uvloop.run(mcp.run_stdio_async())
\ No newline at end of file